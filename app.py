@@ -1,21 +1,21 @@
 from __future__ import annotations
 
+import atexit
 import os
 import io
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import zipfile
-import re
 import json
 
 import pandas as pd
 import streamlit as st
-import pdfplumber
 
-from src.parsing_recibo import parse_recibo_pagamento_pdf
-from src.matching import load_salario_real_xlsx, find_colaborador_ref
-from src.cargos import infer_familia, nivel_por_salario, cargo_final
-from src.export_xlsx import export_xlsx
-from src.receipts_pdf import generate_all_receipts
+# parser (pdfplumber/pdfminer), openpyxl e reportlab são importados só onde são usados:
+# o Streamlit reexecuta o script a cada interação e o cold start não paga por eles.
 
 APP_TITLE = "Demonstrativo de Pagamento Contare"
 ROOT = Path(__file__).parent
@@ -24,89 +24,218 @@ LOGO_PATH = ROOT / "assets" / "logo.png"
 st.set_page_config(page_title=APP_TITLE, layout="wide")
 
 
-def gpt_disambiguate_name(nome_holerite: str, candidatos: list[str], model: str, api_key: str | None) -> str | None:
-    """Usa GPT para escolher o melhor nome da planilha para um nome do holerite (quando há ambiguidade)."""
-    if not api_key or not candidatos:
-        return None
-    try:
-        from openai import OpenAI
-        client = OpenAI(api_key=api_key)
-        system = (
-            "Você é um assistente de conciliação de nomes de funcionários. "
-            "Escolha EXATAMENTE UM nome da lista que corresponde ao nome informado. "
-            "Se não houver correspondência confiável, responda null."
-        )
-        user = {
-            "nome_holerite": nome_holerite,
-            "candidatos_planilha": candidatos
+# formato garantido pela API (structured outputs): uma escolha (ou null) por idx
+_DESAMBIGUACAO_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "escolhas": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"idx": {"type": "integer"}, "escolha": {"type": ["string", "null"]}},
+                "required": ["idx", "escolha"],
+                "additionalProperties": False,
+            },
         }
-        resp = client.responses.create(
-            model=model,
-            input=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": json.dumps(user, ensure_ascii=False)},
-            ],
-            response_format={"type": "json_object"},
-        )
-        txt = resp.output_text
-        data = json.loads(txt) if txt else {}
-        # aceita {"escolha": "..."} ou {"match": "..."} ou {"nome": "..."}
-        for k in ("escolha", "match", "nome"):
-            v = data.get(k)
-            if isinstance(v, str) and v.strip():
-                return v.strip()
-        return None
-    except Exception:
-        return None
-
-def parse_money_any(v) -> float:
-    """Converte valores em float aceitando: 303.60, '303,60', '1.518,00', None."""
-    if v is None:
-        return 0.0
-    if isinstance(v, (int, float)):
-        try:
-            return float(v)
-        except Exception:
-            return 0.0
-    s = str(v).strip()
-    if not s:
-        return 0.0
-    s = re.sub(r"[^0-9,\.\-]", "", s)
-    if not s:
-        return 0.0
-    # pt-BR -> float
-    if "," in s:
-        s = s.replace(".", "").replace(",", ".")
+    },
+    "required": ["escolhas"],
+    "additionalProperties": False,
+}
+
+
+_DESAMBIGUACAO_SYSTEM = (
+    "Você é um assistente de conciliação de nomes de funcionários. "
+    "Para CADA item, escolha EXATAMENTE UM nome da lista de candidatos que corresponde ao nome informado. "
+    "Se não houver correspondência confiável, use null."
+)
+# nomes por requisição; os lotes vão ao GPT em paralelo (a espera é de rede, não de CPU)
+_DESAMBIGUACAO_LOTE = 40
+_DESAMBIGUACAO_WORKERS = 4
+
+
+def _desambiguar_lote(client, model: str, pares: list[tuple[str, list[str]]]) -> dict[int, str]:
+    """Uma requisição para um lote; devolve {posição no lote: nome escolhido}."""
+    user = {
+        "itens": [
+            {"idx": i, "nome_holerite": nome, "candidatos_planilha": candidatos}
+            for i, (nome, candidatos) in enumerate(pares)
+        ]
+    }
+    resp = client.responses.create(
+        model=model,
+        input=[
+            {"role": "system", "content": _DESAMBIGUACAO_SYSTEM},
+            {"role": "user", "content": json.dumps(user, ensure_ascii=False)},
+        ],
+        text={"format": {"type": "json_schema", "name": "desambiguacao", "schema": _DESAMBIGUACAO_SCHEMA, "strict": True}},
+    )
+    return {
+        item["idx"]: item["escolha"].strip()
+        for item in json.loads(resp.output_text)["escolhas"]
+        if 0 <= item["idx"] < len(pares) and item["escolha"] and item["escolha"].strip()
+    }
+
+
+def gpt_disambiguate_names(pares: list[tuple[str, list[str]]], model: str, api_key: str | None,
+                           progresso=None) -> list[str | None]:
+    """Usa GPT para escolher o nome da planilha de cada nome do holerite ambíguo (em lotes paralelos).
+
+    `pares` = [(nome_holerite, candidatos)]; devolve as escolhas na mesma ordem (None = sem match confiável).
+    `progresso`, se informado, é chamado a cada lote concluído e pode levantar exceção para interromper.
+    Falha de um lote na API propaga (os demais são descartados).
+    """
+    escolhas: list[str | None] = [None] * len(pares)
+    if not api_key or not pares:
+        return escolhas
     try:
-        return float(s)
+        from src.parsing_recibo import openai_client
+        client = openai_client(api_key)
     except Exception:
-        return 0.0
-
-def find_referencia_codigo(eventos: list[dict], raw_text: str, codigo: str) -> float | None:
-    """Obtém a 'referência' (ex.: 30,00; 2,00) de um código (ex.: 8781) para proporcionalidade."""
-    # 1) Pela estrutura do GPT
-    for e in (eventos or []):
-        if str(e.get("codigo") or "").strip() == str(codigo):
-            ref = e.get("referencia")
-            if ref is not None:
-                v = parse_money_any(ref)
-                return v if v > 0 else None
-    # 2) Fallback por texto bruto: procura linha com o código e pega o primeiro número pt-BR
-    if raw_text:
-        for ln in raw_text.splitlines():
-            if re.search(rf"\b{re.escape(str(codigo))}\b", ln):
-                m2 = re.search(r"(\d{1,3}(?:\.\d{3})*,\d{2})", ln)
-                if m2:
-                    v = parse_money_any(m2.group(1))
-                    return v if v > 0 else None
-    return None
-
-
-@st.cache_data(show_spinner=False)
-def render_pdf_page_image(pdf_bytes: bytes, page_index: int, dpi: int = 170):
-    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-        page = pdf.pages[int(page_index)]
-        return page.to_image(resolution=dpi).original
+        return escolhas
+
+    # lote com erro (429, timeout...) não vira "sem match": a exceção sobe e o consolidado não é cacheado
+    def _lote(inicio: int) -> tuple[int, dict[int, str]]:
+        return inicio, _desambiguar_lote(client, model, pares[inicio:inicio + _DESAMBIGUACAO_LOTE])
+
+    inicios = range(0, len(pares), _DESAMBIGUACAO_LOTE)
+    ex = ThreadPoolExecutor(max_workers=min(_DESAMBIGUACAO_WORKERS, len(inicios)))
+    try:
+        for k, fut in enumerate(as_completed([ex.submit(_lote, inicio) for inicio in inicios]), start=1):
+            inicio, achados = fut.result()
+            for i, nome in achados.items():
+                escolhas[inicio + i] = nome
+            if progresso:
+                progresso(f"GPT (nomes): lote {k}/{len(inicios)} concluído")
+    finally:
+        # interrompido (cancelamento): descarta os lotes ainda na fila sem esperar por eles
+        ex.shutdown(wait=False, cancel_futures=True)
+    return escolhas
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _parse_pdf_cached(pdf_digest: str, _pdf_bytes: bytes, use_gpt: bool, openai_model: str, _max_workers: int = 1, force_gpt: bool = False, _progresso=None):
+    """Parse do holerite cacheado pelo digest do PDF (reprocessar o mesmo upload não relê o arquivo).
+
+    Só os parâmetros que mudam a extração entram na chave; empresa, limiar, workers etc. não invalidam o cache.
+    Só em memória e com poucas entradas: a folha (nomes, CPFs, salários) não fica gravada em disco.
+    """
+    from src.parsing_recibo import parse_recibo_pagamento_pdf
+    return parse_recibo_pagamento_pdf(_pdf_bytes, use_gpt=use_gpt, openai_model=openai_model,
+                                      max_workers=_max_workers, force_gpt=force_gpt, progresso=_progresso)
+
+
+@st.cache_resource(show_spinner=False)
+def _load_xlsx_cached(xlsx_digest: str, _xlsx_bytes: bytes) -> pd.DataFrame:
+    """Planilha de salários lida uma vez por conteúdo (digest) e compartilhada entre reruns.
+
+    cache_resource devolve o mesmo objeto, sem copiar/despicklar o DataFrame a cada uso;
+    ele é só lido (conciliação), nunca alterado.
+    """
+    from src.matching import load_salario_real_xlsx
+    return load_salario_real_xlsx(io.BytesIO(_xlsx_bytes))
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _consolidar_cached(pdf_digest: str, xlsx_digest: str, use_gpt: bool, force_gpt: bool, openai_model: str, tem_chave: bool,
+                       _colabs: list[dict], competencia_global: str | None, _df_sal: pd.DataFrame,
+                       _progresso=None) -> pd.DataFrame:
+    """Consolidado cacheado pelos digests dos arquivos + parâmetros que alteram o resultado.
+
+    `_colabs`/`_df_sal` não entram no hash: já são função de (pdf_digest, use_gpt, force_gpt, openai_model) e xlsx_digest.
+    """
+    from src.consolidado import consolidar
+    gpt_batch_fn = None
+    if use_gpt and tem_chave:
+        # com "Usar GPT" desligado nenhum nome sai para a OpenAI
+        api_key = os.getenv("OPENAI_API_KEY")
+        gpt_batch_fn = lambda pares: gpt_disambiguate_names(pares, model=openai_model, api_key=api_key, progresso=_progresso)
+    return consolidar(_colabs, competencia_global, _df_sal, gpt_batch_fn=gpt_batch_fn)
+
+
+class _Cancelado(Exception):
+    pass
+
+
+# processamentos em segundo plano ao mesmo tempo no servidor (no máximo um por sessão)
+_JOBS_SIMULTANEOS = 4
+
+
+@st.cache_resource(show_spinner=False)
+def _executor() -> ThreadPoolExecutor:
+    """Pool única do servidor para os jobs de processamento, encerrada na saída do processo.
+
+    Sem shutdown registrado, cada sessão deixava a sua pool (e a thread) para trás.
+    """
+    ex = ThreadPoolExecutor(max_workers=_JOBS_SIMULTANEOS, thread_name_prefix="processar")
+    atexit.register(ex.shutdown, wait=False, cancel_futures=True)
+    return ex
+
+
+def _processar(pdf_bytes: bytes, xlsx_bytes: bytes, opcoes: dict, estado: dict, cancelar: threading.Event) -> dict:
+    """Parse + planilha + consolidado, executado fora da thread do script.
+
+    Não usa st.* nem session_state (não há contexto de script aqui): a etapa atual vai para
+    `estado["etapa"]` e `cancelar` é checado a cada aviso de progresso.
+    """
+    def progresso(msg: str) -> None:
+        if cancelar.is_set():
+            raise _Cancelado()
+        estado["etapa"] = msg
+
+    progresso("Lendo PDF...")
+    pdf_digest = hashlib.sha1(pdf_bytes).hexdigest()
+    colabs, competencia_global = _parse_pdf_cached(
+        pdf_digest,
+        pdf_bytes,
+        # sem chave o GPT não roda: a chave do cache não pode marcar esse resultado como "com GPT"
+        use_gpt=opcoes["usar_gpt"] and opcoes["tem_chave"],
+        openai_model=opcoes["openai_model"],
+        _max_workers=opcoes["workers_pdf"],
+        force_gpt=opcoes["forcar_gpt"],
+        _progresso=progresso,
+    )
+    progresso("Lendo XLSX...")
+    xlsx_digest = hashlib.sha1(xlsx_bytes).hexdigest()
+    df_sal = _load_xlsx_cached(xlsx_digest, xlsx_bytes)
+
+    progresso("Conciliando com a planilha...")
+    df = _consolidar_cached(
+        pdf_digest,
+        xlsx_digest,
+        use_gpt=opcoes["usar_gpt"],
+        force_gpt=opcoes["forcar_gpt"],
+        openai_model=opcoes["openai_model"],
+        tem_chave=opcoes["tem_chave"],
+        _colabs=colabs,
+        competencia_global=competencia_global,
+        _df_sal=df_sal,
+        _progresso=progresso,
+    )
+    return {"df": df, "pdf_bytes": pdf_bytes, "pdf_digest": pdf_digest}
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _pdf_document_cached(pdf_digest: str, _pdf_bytes: bytes):
+    """Documento PDFium aberto uma vez por PDF (por digest) e compartilhado entre reruns.
+
+    Só os últimos PDFs ficam abertos: cada documento segura o arquivo inteiro em memória.
+    """
+    from src.parsing_recibo import open_pdf_document
+    return open_pdf_document(_pdf_bytes)
+
+
+@st.cache_data(show_spinner=False, max_entries=200)
+def render_pdf_page_image(pdf_digest: str, _pdf_bytes: bytes, page_index: int, dpi: int = 100) -> bytes:
+    """Prévia da página já em JPEG: o cache guarda poucos KB e o Streamlit não reencoda em PNG.
+
+    Chave pelo digest do PDF (`_pdf_bytes` não é hasheado a cada troca de colaborador);
+    as páginas saem do documento já aberto, sem reler o cabeçalho/xref do PDF a cada prévia.
+    """
+    from src.parsing_recibo import render_page_image
+    doc = _pdf_document_cached(pdf_digest, _pdf_bytes)
+    buf = io.BytesIO()
+    render_page_image(doc, page_index, dpi=dpi).convert("RGB").save(buf, format="JPEG", quality=80)
+    return buf.getvalue()
 
 # Header
 c1, c2 = st.columns([1, 4])
@@ -120,166 +249,92 @@ with c2:
 # Sidebar
 st.sidebar.header("Configurações")
 empresa_nome = st.sidebar.text_input("Empresa", value="Contare")
-usar_gpt = st.sidebar.toggle("Usar GPT como extrator principal", value=True)
+usar_gpt = st.sidebar.toggle("Usar GPT quando o regex não fechar", value=True)
+forcar_gpt = st.sidebar.toggle("Forçar GPT em todas as páginas", value=False, disabled=not usar_gpt)
 openai_model = st.sidebar.text_input("Modelo OpenAI", value=os.getenv("OPENAI_MODEL", "gpt-4.1"))
+openai_key = os.getenv("OPENAI_API_KEY")
 limiar_liquido_zero = st.sidebar.number_input("Limiar de líquido ~0", value=0.0, min_value=0.0)
+workers_pdf = st.sidebar.number_input("Workers (leitura do PDF e recibos)", value=min(4, os.cpu_count() or 1), min_value=1, max_value=os.cpu_count() or 1, step=1)
 
 st.subheader("1) Uploads")
 pdf_file = st.file_uploader("Holerite/Recibo (PDF)", type=["pdf"])
 xlsx_file = st.file_uploader("Planilha de salário real (XLSX)", type=["xlsx"])
 
+# job de uploads que foram trocados ou removidos não serve mais: cancela e esquece
+entradas = (pdf_file.file_id if pdf_file else None, xlsx_file.file_id if xlsx_file else None)
+job = st.session_state.get("job")
+if job is not None and job["entradas"] != entradas:
+    job["cancelar"].set()
+    del st.session_state["job"]
+
 if not pdf_file or not xlsx_file:
     st.info("Envie o PDF e o XLSX para continuar.")
     st.stop()
 
-tmp = ROOT / ".tmp"
-tmp.mkdir(exist_ok=True)
-pdf_path = tmp / "holerite.pdf"
-xlsx_path = tmp / "salarios.xlsx"
-pdf_path.write_bytes(pdf_file.getbuffer())
-xlsx_path.write_bytes(xlsx_file.getbuffer())
-
 st.subheader("2) Processamento")
-if st.button("Processar", type="primary"):
-    with st.spinner("Lendo PDF..."):
-        colabs, competencia_global = parse_recibo_pagamento_pdf(
-            str(pdf_path),
-            use_gpt=usar_gpt,
-            openai_model=openai_model
-        )
-    with st.spinner("Lendo XLSX..."):
-        df_sal = load_salario_real_xlsx(str(xlsx_path))
-
-    rows = []
-    for c in colabs:
-        ref = find_colaborador_ref(
-            df_sal,
-            nome=c.get('nome'),
-            gpt_match_fn=lambda nome, cands: gpt_disambiguate_name(nome, cands, model=openai_model, api_key=openai_key),
-        )
-        nome = c.get("nome") or ref.get("nome")
-        cpf = c.get("cpf")
-        bruto_ref = ref.get("bruto_referencial")
-        status = (ref.get("status") or "").upper()
-        depto = ref.get("departamento") or ""
-        cargo_base = ref.get("cargo") or ""
-
-        familia = infer_familia(f"{depto} {cargo_base}")
-        nivel = nivel_por_salario(bruto_ref) if bruto_ref is not None else None
-        cargo_plano = cargo_final(familia, nivel) if bruto_ref is not None else None
-
-        liquido = c.get("liquido")
-        eventos = c.get("eventos") or []
-
-        # apurar verbas
-        salario_contratual_8781 = 0.0
-        inss = 0.0
-        verba_981 = 0.0
-        for e in eventos:
-            cod = str(e.get("codigo") or "").strip()
-            desc = str(e.get("descricao") or "").upper()
-            provento = parse_money_any(e.get('provento')) or parse_money_any(e.get('vencimentos'))
-            desconto = parse_money_any(e.get('desconto')) or parse_money_any(e.get('descontos'))
-            if cod == "8781":
-                salario_contratual_8781 += provento
-            if cod == "981":
-                verba_981 += desconto
-            if cod == "998" or "INSS" in desc:
-                inss += desconto
-
-
-
-        # Cálculo (V7 - claro e objetivo):
-        # Remuneração Bruta (planilha)
-        # (+) Outros Proventos (holerite, exceto 8781)
-        # (-) Desc. Adiantamento (981)
-        # (-) Desc. INSS (998 ou descrição INSS)
-        # (-) Outros Descontos (demais descontos)
-        # = Remuneração Líquida (VALOR A PAGAR)
-        regra = "DEMONSTRATIVO: Bruto(planilha) + Outros Proventos - 981 - INSS - Outros Descontos"
-        valor_a_pagar = None
-
-        # componentes para exibição/relatório
-        outros_proventos = None
-        desc_adiantamento = None
-        desc_inss = None
-        outros_descontos = None
-
-        # Inicializa para evitar NameError em casos sem bruto_ref
-        ref_8781 = None
-        bruto_proporcional = None
-
-        if bruto_ref is not None:
-            # Recalcular componentes a partir dos eventos (independente do 'liquido' do holerite)
-            total_proventos = 0.0
-            total_descontos = 0.0
-
-            for e in eventos:
-                pro = parse_money_any(e.get('provento')) or parse_money_any(e.get('vencimentos'))
-                des = parse_money_any(e.get('desconto')) or parse_money_any(e.get('descontos'))
-                total_proventos += float(pro or 0.0)
-                total_descontos += float(des or 0.0)
-
-            # Outros proventos = total proventos - 8781 (salário contratual)
-            outros_proventos = max(float(total_proventos) - float(salario_contratual_8781), 0.0)
-
-            desc_adiantamento = float(verba_981)
-            desc_inss = float(inss)
-
-            # Outros descontos = total descontos - (981 + INSS)
-            outros_descontos = max(float(total_descontos) - float(desc_adiantamento) - float(desc_inss), 0.0)
-
-            # Proporcionalidade por referência: 30,00 = salário cheio; diferente disso -> proporcional
-            ref_8781 = find_referencia_codigo(eventos, c.get('raw_text',''), '8781')
-            bruto_base = float(bruto_ref)
-            bruto_proporcional = bruto_base
-            if ref_8781 is not None and float(ref_8781) > 0 and abs(float(ref_8781) - 30.0) > 1e-6:
-                bruto_proporcional = bruto_base * (float(ref_8781) / 30.0)
-
-            valor_a_pagar = float(bruto_proporcional) + float(outros_proventos) - float(desc_adiantamento) - float(desc_inss) - float(outros_descontos)
-            valor_a_pagar = max(valor_a_pagar, 0.0)
-
-        rows.append({
-            "competencia": c.get("competencia") or competencia_global,
-            "nome": nome,
-            "cpf": cpf,
-            "departamento": depto or None,
-            "cargo_plano": cargo_plano,
-            "status": ref.get("status"),
-            "bruto_planilha": bruto_ref,
-            "liquido_holerite": liquido,
-            "8781_salario_contratual": salario_contratual_8781,
-            "998_inss": inss,
-            "981_desc_adiantamento": verba_981,
-            "regra_aplicada": regra,
-            "valor_a_pagar": valor_a_pagar,
-            "remuneracao_bruta_planilha": bruto_ref,
-            "referencia_8781": ref_8781,
-            "remuneracao_bruta_proporcional": bruto_proporcional,
-            "outros_proventos": outros_proventos,
-            "desc_adiantamento_981": desc_adiantamento,
-            "desc_inss_998": desc_inss,
-            "outros_descontos": outros_descontos,
-            "page_index": c.get("page_index", 0),
-            "eventos": eventos,
-            "raw_text": c.get("raw_text", ""),
-        })
-
-    df = pd.DataFrame(rows)
-    st.session_state["df"] = df
-    st.session_state["pdf_bytes"] = pdf_path.read_bytes()
-    st.success(f"Processado: {len(df)} colaborador(es).")
+job = st.session_state.get("job")
+if st.button("Processar", type="primary", disabled=job is not None):
+    # o processamento roda numa thread à parte; o script só acompanha (e pode cancelar)
+    opcoes = {
+        "usar_gpt": usar_gpt,
+        "forcar_gpt": forcar_gpt,
+        "openai_model": openai_model,
+        "workers_pdf": int(workers_pdf),
+        "tem_chave": bool(openai_key),
+    }
+    estado = {"etapa": "Na fila..."}
+    cancelar = threading.Event()
+    future = _executor().submit(_processar, pdf_file.getvalue(), xlsx_file.getvalue(), opcoes, estado, cancelar)
+    job = st.session_state["job"] = {"future": future, "estado": estado, "cancelar": cancelar, "entradas": entradas}
+
+if job is not None:
+    if not job["future"].done():
+        with st.status(job["estado"]["etapa"], state="running"):
+            st.caption("Processando em segundo plano; a tela atualiza sozinha.")
+        if st.button("Cancelar", disabled=job["cancelar"].is_set()):
+            job["cancelar"].set()
+        time.sleep(0.5)
+        st.rerun()
+
+    del st.session_state["job"]
+    try:
+        res = job["future"].result()
+    except _Cancelado:
+        st.warning("Processamento cancelado.")
+    except Exception as e:
+        st.error(f"Falha no processamento: {e}")
+    else:
+        df = res["df"]
+        # eventos/texto bruto (pesados) ficam num dicionário à parte, por posição; o df guardado
+        # no session_state fica só com as colunas tabulares, reaproveitadas a cada rerun
+        st.session_state["raw_bundles"] = {
+            i: {"eventos": ev, "raw_text": txt}
+            for i, (ev, txt) in enumerate(zip(df["eventos"], df["raw_text"]))
+        }
+        df = df.drop(columns=["eventos", "raw_text"], errors="ignore")
+        st.session_state["df"] = df
+        st.session_state["eventos_df"] = {}  # posição -> DataFrame de eventos, montado na 1ª visualização
+        st.session_state["pdf_bytes"] = res["pdf_bytes"]
+        st.session_state["pdf_digest"] = res["pdf_digest"]
+        # rótulos do seletor do Espelho montados uma vez por processamento, não a cada rerun
+        st.session_state["rotulos"] = [
+            f"{n}" + (f" — {c}" if str(c).strip() else "")
+            for n, c in zip(df["nome"], df["cpf"].astype(object).where(df["cpf"].notna(), ""))
+        ]
+        st.success(f"Processado: {len(df)} colaborador(es).")
 
 df = st.session_state.get("df")
 if df is not None:
     tab1, tab2, tab3 = st.tabs(["Consolidado", "Espelho do Recibo", "Exportações"])
 
     with tab1:
-        st.dataframe(df.drop(columns=["eventos","raw_text"], errors="ignore"), use_container_width=True)
+        st.dataframe(df, use_container_width=True)
 
     with tab2:
-        idx = st.selectbox("Selecione o colaborador", df.index, format_func=lambda i: f"{df.loc[i,'nome']}" + (f" — {df.loc[i,'cpf']}" if str(df.loc[i,'cpf'] or '').strip() else ''))
-        row = df.loc[idx]
+        labels = st.session_state["rotulos"]
+        pos = st.selectbox("Selecione o colaborador", range(len(labels)), format_func=labels.__getitem__)
+        row = df.iloc[pos].to_dict()  # dict simples: os .get abaixo não passam pelo indexador do pandas
+        bundle = st.session_state["raw_bundles"][pos]
 
         cA, cB, cC, cD = st.columns(4)
         cA.metric("Competência", row.get("competencia"))
@@ -289,37 +344,41 @@ if df is not None:
         cD.metric("Remuneração Líquida a Pagar", row.get("valor_a_pagar"))
 
         st.markdown("### Holerite original (imagem)")
-        img = render_pdf_page_image(st.session_state["pdf_bytes"], int(row.get("page_index") or 0))
+        dpi_previa = st.slider("Resolução da prévia (DPI)", min_value=72, max_value=200, value=100, step=4)
+        img = render_pdf_page_image(st.session_state["pdf_digest"], st.session_state["pdf_bytes"],
+                                    int(row.get("page_index") or 0), dpi=dpi_previa)
         st.image(img, use_container_width=True)
 
         st.markdown("### Eventos (extraídos pelo GPT)")
-        ev = row.get("eventos") or []
-        st.dataframe(pd.DataFrame(ev), use_container_width=True, hide_index=True)
+        eventos_df = st.session_state.setdefault("eventos_df", {})
+        if pos not in eventos_df:
+            eventos_df[pos] = pd.DataFrame(bundle["eventos"] or [])
+        st.dataframe(eventos_df[pos], use_container_width=True, hide_index=True)
 
         with st.expander("Texto bruto (debug)"):
-            st.text(row.get("raw_text") or "")
+            st.text(bundle["raw_text"] or "")
 
     with tab3:
-        out_dir = ROOT / ".out"
-        out_dir.mkdir(exist_ok=True)
-
         colA, colB = st.columns(2)
         with colA:
             if st.button("Gerar Excel (Consolidado)"):
-                xlsx_out = out_dir / "consolidado.xlsx"
-                export_xlsx(df.drop(columns=["eventos","raw_text"], errors="ignore"), str(xlsx_out), logo_path=str(LOGO_PATH) if LOGO_PATH.exists() else None)
-                st.download_button("Baixar Consolidado.xlsx", xlsx_out.read_bytes(), file_name="consolidado.xlsx",
+                from src.export_xlsx import export_xlsx
+                xlsx_buf = io.BytesIO()
+                export_xlsx(df, xlsx_buf, logo_path=str(LOGO_PATH) if LOGO_PATH.exists() else None)
+                st.download_button("Baixar Consolidado.xlsx", xlsx_buf.getvalue(), file_name="consolidado.xlsx",
                                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 
         with colB:
             if st.button("Gerar ZIP de Recibos Complementares (PDF)"):
-                pdfs_dir = out_dir / "recibos"
-                pdfs_dir.mkdir(exist_ok=True)
-                pdfs = generate_all_receipts(df.to_dict(orient="records"), out_dir=str(pdfs_dir), empresa_nome=empresa_nome,
-                                            logo_path=str(LOGO_PATH) if LOGO_PATH.exists() else None,
-                                            holerite_pdf_bytes=st.session_state.get('pdf_bytes'))
-                zip_out = out_dir / "recibos.zip"
-                with zipfile.ZipFile(zip_out, "w", zipfile.ZIP_DEFLATED) as z:
-                    for p in pdfs:
-                        z.write(p, arcname=Path(p).name)
-                st.download_button("Baixar Recibos.zip", zip_out.read_bytes(), file_name="recibos.zip", mime="application/zip")
+                from src.receipts_pdf import generate_all_receipts_iter
+                recibos = generate_all_receipts_iter(df, empresa_nome=empresa_nome,
+                                                     logo_path=str(LOGO_PATH) if LOGO_PATH.exists() else None,
+                                                     holerite_pdf_bytes=st.session_state.get('pdf_bytes'),
+                                                     max_workers=int(workers_pdf))
+                # PDFs já saem comprimidos (FlateDecode): deflate de novo só gasta CPU.
+                # O ZIP é montado em memória, direto para o download (sem passar pelo disco).
+                zip_buf = io.BytesIO()
+                with zipfile.ZipFile(zip_buf, "w", zipfile.ZIP_STORED) as z:
+                    for nome_arquivo, data in recibos:
+                        z.writestr(nome_arquivo, data)
+                st.download_button("Baixar Recibos.zip", zip_buf.getvalue(), file_name="recibos.zip", mime="application/zip")
@@ -1,6 +1,10 @@
 from __future__ import annotations
+from bisect import bisect_right
 from typing import Optional
 
+import numpy as np
+import pandas as pd
+
 def infer_familia(texto: str) -> str:
     t = (texto or "").lower()
     if "fiscal" in t: return "Fiscal"
@@ -8,14 +12,36 @@ def infer_familia(texto: str) -> str:
     if "contab" in t: return "Contábil"
     return "Geral"
 
+# faixas de salário: limite inferior de cada nível a partir do 2º (mesma tabela na versão vetorizada)
+_FAIXAS_LIMITES = (2500.0, 3500.0, 5000.0, 7000.0)
+_FAIXAS_ROTULOS = ("Assistente I", "Assistente II", "Analista Jr", "Analista Pl", "Analista Sr")
+
 def nivel_por_salario(bruto: Optional[float]) -> Optional[str]:
     if bruto is None: return None
-    b = float(bruto)
-    if b < 2500: return "Assistente I"
-    if b < 3500: return "Assistente II"
-    if b < 5000: return "Analista Jr"
-    if b < 7000: return "Analista Pl"
-    return "Analista Sr"
+    return _FAIXAS_ROTULOS[bisect_right(_FAIXAS_LIMITES, float(bruto))]
 
 def cargo_final(familia: str, nivel: Optional[str]) -> str:
     return f"{nivel} {familia or 'Geral'}" if nivel else (familia or 'Geral')
+
+
+# Versões vetorizadas (uma chamada para a coluna inteira), mesmas regras das funções acima.
+
+_NIVEL_LIMITES = np.array(_FAIXAS_LIMITES, dtype=float)
+_NIVEL_ROTULOS = np.array(_FAIXAS_ROTULOS, dtype=object)
+
+def infer_familia_serie(texto: pd.Series) -> pd.Series:
+    # depto+cargo se repetem muito na folha: classifica só os textos distintos e espalha pelos códigos;
+    # com poucos distintos, a cadeia de `in` de infer_familia sai mais barata que 3 varreduras .str da coluna
+    codigos, distintos = pd.factorize(texto.fillna("").astype(str), use_na_sentinel=False)
+    familias = np.array([infer_familia(t) for t in distintos], dtype=object)
+    return pd.Series(familias[codigos], index=texto.index)
+
+def nivel_por_salario_serie(bruto: pd.Series) -> pd.Series:
+    b = pd.to_numeric(bruto, errors="coerce").to_numpy(dtype=float)
+    niveis = _NIVEL_ROTULOS[np.searchsorted(_NIVEL_LIMITES, b, side="right")]
+    return pd.Series(np.where(np.isnan(b), None, niveis), index=bruto.index, dtype=object)
+
+def cargo_final_serie(familia: pd.Series, nivel: pd.Series) -> pd.Series:
+    familia = familia.where(familia.notna() & familia.astype(bool), "Geral")
+    # fillna/astype: com todos os níveis ausentes a soma de strings não teria um dtype de texto
+    return (nivel.fillna("").astype(str) + " " + familia.astype(str)).where(nivel.notna(), familia)
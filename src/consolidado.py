@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from src.matching import match_colaboradores
+from src.parsing_recibo import parse_money_any as _parse_money
+from src.cargos import infer_familia_serie, nivel_por_salario_serie, cargo_final_serie
+
+_COD_8781_RE = re.compile(r"\b8781\b")
+_VALOR_BR_RE = re.compile(r"(\d{1,3}(?:\.\d{3})*,\d{2})")
+
+
+def parse_money_any(v) -> float:
+    """Converte valores em float aceitando: 303.60, '303,60', '1.518,00', None (ausente -> 0.0)."""
+    v = _parse_money(v)
+    return 0.0 if v is None else v
+
+
+def _referencia_no_texto(raw_text: str, codigo_re: re.Pattern) -> float | None:
+    """Fallback por texto bruto: primeira linha com o código e o primeiro número pt-BR dela."""
+    if not isinstance(raw_text, str):
+        return None
+    for ln in raw_text.splitlines():
+        if codigo_re.search(ln):
+            m2 = _VALOR_BR_RE.search(ln)
+            if m2:
+                v = parse_money_any(m2.group(1))
+                return v if v > 0 else None
+    return None
+
+
+def _money_col(s: pd.Series) -> pd.Series:
+    """Aplica parse_money_any na coluna inteira (ausentes -> 0.0)."""
+    return s.map(parse_money_any, na_action="ignore").fillna(0.0).astype(float)
+
+
+def _preenchido(s: pd.Series) -> pd.Series:
+    """Equivalente vetorizado de `bool(v)` para colunas de texto/objeto."""
+    return s.notna() & s.astype(str).str.len().gt(0)
+
+
+def eventos_dataframe(colabs: list[dict]) -> pd.DataFrame:
+    """Achata os eventos de todos os colaboradores em um DataFrame longo.
+
+    Uma linha por evento; 'cid' é a posição do colaborador em `colabs`.
+    Já devolve código/descrição normalizados e os valores de provento/desconto em float.
+    """
+    listas = [c.get("eventos") or [] for c in colabs]
+    cols = ["codigo", "descricao", "referencia", "provento", "vencimentos", "desconto", "descontos"]
+    # os dicts de evento entram como estão (sem cópia por evento); o cid vem de um repeat
+    ev = pd.DataFrame([e for lista in listas for e in lista], dtype=object).reindex(columns=cols)
+    cid = np.repeat(np.arange(len(listas)), [len(lista) for lista in listas])
+
+    pro = _money_col(ev["provento"])
+    des = _money_col(ev["desconto"])
+    return pd.DataFrame({
+        "cid": cid,
+        "codigo": ev["codigo"].where(_preenchido(ev["codigo"]), "").astype(str).str.strip(),
+        "descricao_up": ev["descricao"].where(_preenchido(ev["descricao"]), "").astype(str).str.upper(),
+        "referencia": ev["referencia"],
+        # provento OU vencimentos / desconto OU descontos (mesma precedência do `or`)
+        "provento": pro.where(pro != 0, _money_col(ev["vencimentos"])),
+        "desconto": des.where(des != 0, _money_col(ev["descontos"])),
+    })
+
+
+def consolidar(colabs: list[dict], competencia_global: str | None, df_sal: pd.DataFrame, gpt_match_fn=None,
+               gpt_batch_fn=None) -> pd.DataFrame:
+    """Monta o consolidado (uma linha por colaborador) com operações vetorizadas.
+
+    Cálculo (V7 - claro e objetivo):
+      Remuneração Bruta (planilha)
+      (+) Outros Proventos (holerite, exceto 8781)
+      (-) Desc. Adiantamento (981)
+      (-) Desc. INSS (998 ou descrição INSS)
+      (-) Outros Descontos (demais descontos)
+      = Remuneração Líquida (VALOR A PAGAR)
+    """
+    if not colabs:
+        return pd.DataFrame()
+
+    n = len(colabs)
+    base = pd.DataFrame(colabs).reindex(columns=["competencia", "nome", "cpf", "liquido", "page_index", "raw_text"])
+    refs = match_colaboradores(df_sal, [c.get("nome") for c in colabs], gpt_match_fn=gpt_match_fn,
+                               gpt_batch_fn=gpt_batch_fn)
+
+    # apurar verbas (todos os eventos de uma vez)
+    ev = eventos_dataframe(colabs)
+    is_inss = (ev["codigo"] == "998") | ev["descricao_up"].str.contains("INSS", regex=False)
+    # soma por colaborador com bincount (uma redução numpy por coluna, já com os n colaboradores)
+    cid = ev["cid"].to_numpy()
+    somas = {
+        "total_proventos": ev["provento"],
+        "total_descontos": ev["desconto"],
+        "v8781": ev["provento"].where(ev["codigo"] == "8781", 0.0),
+        "v981": ev["desconto"].where(ev["codigo"] == "981", 0.0),
+        "inss": ev["desconto"].where(is_inss, 0.0),
+    }
+    verbas = pd.DataFrame({k: np.bincount(cid, weights=v.to_numpy(dtype=float), minlength=n).astype(float) for k, v in somas.items()})
+
+    bruto_ref = pd.to_numeric(refs["bruto_referencial"], errors="coerce")
+    tem_bruto = bruto_ref.notna()
+    depto = refs["departamento"].where(_preenchido(refs["departamento"]), "")
+    cargo_base = refs["cargo"].where(_preenchido(refs["cargo"]), "")
+
+    familia = infer_familia_serie(depto.astype(str).str.cat(cargo_base.astype(str), sep=" "))
+    cargo_plano = cargo_final_serie(familia, nivel_por_salario_serie(bruto_ref)).where(tem_bruto, None)
+
+    # Proporcionalidade por referência: 30,00 = salário cheio; diferente disso -> proporcional
+    # 1) primeiro evento 8781 com referência, por colaborador (uma passada sobre os eventos)
+    com_ref = ev.loc[(ev["codigo"] == "8781") & ev["referencia"].notna(), ["cid", "referencia"]]
+    com_ref = com_ref.drop_duplicates("cid").set_index("cid")["referencia"]
+    ref_ev = com_ref.map(parse_money_any)
+    ref_8781 = ref_ev.where(ref_ev > 0).reindex(range(n)).astype(float)
+    # 2) texto bruto só para quem não tem o 8781 nos eventos
+    for i in np.flatnonzero(tem_bruto.to_numpy() & ~np.isin(np.arange(n), com_ref.index)):
+        ref_8781.iat[i] = _referencia_no_texto(base["raw_text"].iat[i], _COD_8781_RE)
+    ref_8781 = ref_8781.where(tem_bruto)
+    proporcional = ref_8781.gt(0) & (ref_8781 - 30.0).abs().gt(1e-6)
+    bruto_proporcional = bruto_ref.where(~proporcional, bruto_ref * (ref_8781 / 30.0))
+
+    # Outros proventos = total proventos - 8781; outros descontos = total descontos - (981 + INSS)
+    outros_proventos = (verbas["total_proventos"] - verbas["v8781"]).clip(lower=0.0).where(tem_bruto)
+    desc_adiantamento = verbas["v981"].where(tem_bruto)
+    desc_inss = verbas["inss"].where(tem_bruto)
+    outros_descontos = (verbas["total_descontos"] - verbas["v981"] - verbas["inss"]).clip(lower=0.0).where(tem_bruto)
+
+    valor_a_pagar = (bruto_proporcional + outros_proventos - desc_adiantamento - desc_inss - outros_descontos).clip(lower=0.0)
+
+    return pd.DataFrame({
+        "competencia": base["competencia"].where(_preenchido(base["competencia"]), competencia_global),
+        "nome": base["nome"].where(_preenchido(base["nome"]), refs["nome"]),
+        "cpf": base["cpf"],
+        "departamento": depto.where(depto != "", None),
+        "cargo_plano": cargo_plano,
+        "status": refs["status"],
+        "bruto_planilha": bruto_ref,
+        "liquido_holerite": base["liquido"],
+        "8781_salario_contratual": verbas["v8781"],
+        "998_inss": verbas["inss"],
+        "981_desc_adiantamento": verbas["v981"],
+        "regra_aplicada": "DEMONSTRATIVO: Bruto(planilha) + Outros Proventos - 981 - INSS - Outros Descontos",
+        "valor_a_pagar": valor_a_pagar,
+        "remuneracao_bruta_planilha": bruto_ref,
+        "referencia_8781": ref_8781.where(tem_bruto),
+        "remuneracao_bruta_proporcional": bruto_proporcional,
+        "outros_proventos": outros_proventos,
+        "desc_adiantamento_981": desc_adiantamento,
+        "desc_inss_998": desc_inss,
+        "outros_descontos": outros_descontos,
+        "page_index": base["page_index"].fillna(0).astype(int),
+        "eventos": pd.Series([c.get("eventos") or [] for c in colabs], dtype=object),
+        "raw_text": base["raw_text"].fillna(""),
+    })
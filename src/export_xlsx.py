@@ -1,15 +1,32 @@
 from __future__ import annotations
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, Optional, Union
 import pandas as pd
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, PatternFill
 from openpyxl.drawing.image import Image as XLImage
+from openpyxl.utils import get_column_letter
 
-def export_xlsx(df: pd.DataFrame, out_path: str, logo_path: Optional[str] = None) -> None:
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Relatório"
+def _larguras(df: pd.DataFrame) -> list[float]:
+    """Largura de cada coluna pelo maior texto (cabeçalho incluso), entre 12 e 45."""
+    larguras = []
+    for col in df.columns:
+        s = df[col]
+        lens = s[s.notna()].astype(str).str.len()
+        max_len = max(len(str(col)), int(lens.max()) if len(lens) else 0)
+        larguras.append(min(max(max_len + 2, 12), 45))
+    return larguras
+
+def export_xlsx(df: pd.DataFrame, out_path: Union[str, BinaryIO], logo_path: Optional[str] = None) -> None:
+    """Grava o relatório em `out_path` (caminho ou arquivo em memória, ex.: BytesIO)."""
+    # write_only: as linhas vão direto para o arquivo, sem um objeto Cell por valor em memória
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Relatório")
+
+    # no modo write_only as larguras precisam ser definidas antes das linhas
+    for j, w in enumerate(_larguras(df), start=1):
+        ws.column_dimensions[get_column_letter(j)].width = w
 
     if logo_path and Path(logo_path).exists():
         try:
@@ -23,20 +40,21 @@ def export_xlsx(df: pd.DataFrame, out_path: str, logo_path: Optional[str] = None
     start = 5
     header_font = Font(bold=True, color="FFFFFF")
     header_fill = PatternFill("solid", fgColor="2F5597")
+    header_align = Alignment(horizontal="center", vertical="center", wrap_text=True)
 
-    for j, col in enumerate(df.columns, start=1):
-        cell = ws.cell(row=start, column=j, value=str(col))
+    for _ in range(start - 1):
+        ws.append([])
+
+    header = []
+    for col in df.columns:
+        cell = WriteOnlyCell(ws, value=str(col))
         cell.font = header_font
         cell.fill = header_fill
-        cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-
-    for i, row in enumerate(df.itertuples(index=False), start=start+1):
-        for j, v in enumerate(row, start=1):
-            ws.cell(row=i, column=j, value=v)
+        cell.alignment = header_align
+        header.append(cell)
+    ws.append(header)
 
-    for col in ws.columns:
-        col_letter = col[0].column_letter
-        max_len = max((len(str(c.value)) for c in col if c.value is not None), default=10)
-        ws.column_dimensions[col_letter].width = min(max(max_len + 2, 12), 45)
+    for row in df.itertuples(index=False):
+        ws.append(row)
 
     wb.save(out_path)
@@ -2,11 +2,16 @@ from __future__ import annotations
 
 import re
 import unicodedata
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, List, Tuple, Union, BinaryIO
 
 import pandas as pd
 
 
+_NAO_ALFANUM_RE = re.compile(r"[^A-Za-z0-9 ]+")
+_ESPACOS_RE = re.compile(r"\s+")
+_NAO_NUMERICO_RE = re.compile(r"[^0-9\.,\-]")
+
+
 def _detect(df: pd.DataFrame, names: list[str]) -> Optional[str]:
     cols = {str(c).strip().upper(): c for c in df.columns}
     for n in names:
@@ -26,8 +31,8 @@ def norm_nome(s: Optional[str]) -> str:
     s = str(s)
     s = unicodedata.normalize("NFKD", s)
     s = "".join(ch for ch in s if not unicodedata.combining(ch))
-    s = re.sub(r"[^A-Za-z0-9 ]+", " ", s)
-    s = re.sub(r"\s+", " ", s).strip().upper()
+    s = _NAO_ALFANUM_RE.sub(" ", s)
+    s = _ESPACOS_RE.sub(" ", s).strip().upper()
     return s
 
 
@@ -37,6 +42,12 @@ def _tokens(s: str) -> List[str]:
 
 def _score(a: str, b: str) -> float:
     """Score 0..1 por overlap de tokens + bônus por primeiro/último nome."""
+    ta, tb = _tokens(a), _tokens(b)
+    return _score_tokens(a, ta, set(ta), b, tb, set(tb))
+
+
+def _score_tokens(a: str, ta: List[str], sa: set, b: str, tb: List[str], sb: set) -> float:
+    """`_score` com os tokens já calculados (o lado da planilha é tokenizado uma vez só)."""
     if not a or not b:
         return 0.0
     if a == b:
@@ -44,9 +55,6 @@ def _score(a: str, b: str) -> float:
     if a in b or b in a:
         return 0.93
 
-    ta = _tokens(a)
-    tb = _tokens(b)
-    sa, sb = set(ta), set(tb)
     inter = len(sa & sb)
     union = len(sa | sb) or 1
     j = inter / union
@@ -64,7 +72,7 @@ def _to_float(v) -> Optional[float]:
     if v is None or (isinstance(v, float) and pd.isna(v)):
         return None
     t = str(v).strip()
-    t = re.sub(r"[^0-9\.,\-]", "", t)
+    t = _NAO_NUMERICO_RE.sub("", t)
     if not t:
         return None
     if "," in t:
@@ -75,8 +83,16 @@ def _to_float(v) -> Optional[float]:
         return None
 
 
-def load_salario_real_xlsx(path: str) -> pd.DataFrame:
-    """Planilha mínima: Nome + Valor/Bruto. Outras colunas são opcionais."""
+def _texto_ou_none(s: pd.Series) -> pd.Series:
+    """Texto sem espaços nas pontas; célula vazia vira None (e não a string 'nan')."""
+    return s.astype(object).where(s.notna(), None).map(lambda v: str(v).strip(), na_action="ignore")
+
+
+def load_salario_real_xlsx(path: Union[str, BinaryIO]) -> pd.DataFrame:
+    """Planilha mínima: Nome + Valor/Bruto. Outras colunas são opcionais.
+
+    `path` pode ser caminho ou arquivo em memória (BytesIO).
+    """
     df = pd.read_excel(path, dtype=str)
 
     nome_col = _detect(df, ["NOME", "COLABORADOR", "FUNCIONARIO", "FUNCIONÁRIO"])
@@ -95,34 +111,41 @@ def load_salario_real_xlsx(path: str) -> pd.DataFrame:
     status_col = _detect(df, ["STATUS", "SITUACAO", "SITUAÇÃO"])
     depto_col = _detect(df, ["DEPARTAMENTO", "DEPTO", "SETOR", "AREA", "ÁREA"])
     cargo_col = _detect(df, ["CARGO", "FUNCAO", "FUNÇÃO"])
-    df["__STATUS__"] = df[status_col] if status_col else None
-    df["__DEPTO__"] = df[depto_col] if depto_col else None
-    df["__CARGO__"] = df[cargo_col] if cargo_col else None
+    df["__STATUS__"] = _texto_ou_none(df[status_col]) if status_col else None
+    df["__DEPTO__"] = _texto_ou_none(df[depto_col]) if depto_col else None
+    df["__CARGO__"] = _texto_ou_none(df[cargo_col]) if cargo_col else None
+
+    # normalizações feitas uma vez na carga (a planilha fica em cache); a conciliação só lê
+    df["__BRUTO_REF__"] = pd.Series([_to_float(v) for v in df["__BRUTO_COL__"].tolist()], index=df.index, dtype=object)
 
     return df
 
 
-def _top_candidates(df: pd.DataFrame, nome_holerite: str, k: int = 12) -> List[Tuple[int, float, str]]:
+def _indice_nomes(df: pd.DataFrame) -> List[Tuple[Any, str, List[str], set, str]]:
+    """(índice, nome normalizado, tokens, conjunto de tokens, nome original) de cada linha da planilha."""
+    out = []
+    for idx, b, nm in zip(df.index, df["NOME_NORM"].tolist(), df["__NOME_COL__"].tolist()):
+        b = str(b)
+        tb = _tokens(b)
+        out.append((idx, b, tb, set(tb), str(nm)))
+    return out
+
+
+def _top_candidates(df: pd.DataFrame, nome_holerite: str, k: int = 12, indice=None) -> List[Tuple[int, float, str]]:
     a = norm_nome(nome_holerite)
+    ta = _tokens(a)
+    sa = set(ta)
     cands: List[Tuple[int, float, str]] = []
-    for idx, b in df["NOME_NORM"].items():
-        s = _score(a, str(b))
+    for idx, b, tb, sb, nm in (indice if indice is not None else _indice_nomes(df)):
+        s = _score_tokens(a, ta, sa, b, tb, sb)
         if s > 0:
-            cands.append((idx, s, str(df.loc[idx, "__NOME_COL__"])))
+            cands.append((idx, s, nm))
     cands.sort(key=lambda x: x[1], reverse=True)
     return cands[:k]
 
 
-def find_colaborador_ref(
-    df: pd.DataFrame,
-    nome: Optional[str],
-    *,
-    gpt_match_fn=None,
-    min_score: float = 0.70,
-    force_gpt_below: float = 0.95,
-) -> Dict[str, Any]:
-    """Identificação APENAS por nome. GPT desambigua quando não é match perfeito."""
-    out = {
+def _empty_ref() -> Dict[str, Any]:
+    return {
         "bruto_referencial": None,
         "status": None,
         "departamento": None,
@@ -132,6 +155,44 @@ def find_colaborador_ref(
         "match_nome_planilha": None,
         "match_metodo": None,
     }
+
+
+def _ref_from_row(r, nome: Optional[str], score: float, metodo: str) -> Dict[str, Any]:
+    """Campos de referência a partir de uma linha da planilha (Series ou dict)."""
+    return {
+        "bruto_referencial": r.get("__BRUTO_REF__"),
+        "status": r.get("__STATUS__"),
+        "departamento": r.get("__DEPTO__"),
+        "cargo": r.get("__CARGO__"),
+        "nome": str(r.get("__NOME_COL__", "")).strip().title() or nome,
+        "match_score": float(score),
+        "match_nome_planilha": str(r.get("__NOME_COL__", "")).strip(),
+        "match_metodo": metodo,
+    }
+
+
+def _precisa_gpt(cands: List[Tuple[int, float, str]], force_gpt_below: float) -> bool:
+    """Match fuzzy duvidoso: abaixo do limiar ou com o 2º candidato colado no 1º."""
+    best_score = cands[0][1]
+    return best_score < force_gpt_below or (len(cands) > 1 and cands[1][1] >= best_score - 0.04)
+
+
+def find_colaborador_ref(
+    df: pd.DataFrame,
+    nome: Optional[str],
+    *,
+    gpt_match_fn=None,
+    min_score: float = 0.70,
+    force_gpt_below: float = 0.95,
+    _indice=None,
+    _cands=None,
+) -> Dict[str, Any]:
+    """Identificação APENAS por nome. GPT desambigua quando não é match perfeito.
+
+    `_indice` (de `_indice_nomes`) evita retokenizar a planilha a cada nome quando há vários;
+    `_cands` reaproveita os candidatos já calculados por `match_colaboradores`.
+    """
+    out = _empty_ref()
     if df is None or len(df) == 0:
         return out
 
@@ -139,44 +200,66 @@ def find_colaborador_ref(
 
     exact = df[df["NOME_NORM"] == a]
     if len(exact) == 1:
-        r = exact.iloc[0]
-        out.update({
-            "bruto_referencial": _to_float(r.get("__BRUTO_COL__")),
-            "status": (str(r.get("__STATUS__")).strip() if r.get("__STATUS__") is not None else None),
-            "departamento": (str(r.get("__DEPTO__")).strip() if r.get("__DEPTO__") is not None else None),
-            "cargo": (str(r.get("__CARGO__")).strip() if r.get("__CARGO__") is not None else None),
-            "nome": str(r.get("__NOME_COL__", "")).strip().title() or nome,
-            "match_score": 1.0,
-            "match_nome_planilha": str(r.get("__NOME_COL__", "")).strip(),
-            "match_metodo": "nome_exato",
-        })
+        out.update(_ref_from_row(exact.iloc[0], nome, 1.0, "nome_exato"))
         return out
 
-    cands = _top_candidates(df, nome or "", k=12)
+    cands = _cands if _cands is not None else _top_candidates(df, nome or "", k=12, indice=_indice)
     if not cands or cands[0][1] < min_score:
         return out
 
     best_idx, best_score, best_nome = cands[0]
     metodo = "nome_fuzzy"
 
-    if gpt_match_fn is not None and (best_score < force_gpt_below or (len(cands) > 1 and cands[1][1] >= best_score - 0.04)):
+    if gpt_match_fn is not None and _precisa_gpt(cands, force_gpt_below):
         picked = gpt_match_fn(nome or "", [c[2] for c in cands])
         if picked:
+            picked_up = str(picked).strip().upper()
             for idx, sc, nm in cands:
-                if str(nm).strip().upper() == str(picked).strip().upper():
+                if str(nm).strip().upper() == picked_up:
                     best_idx, best_score, best_nome = idx, max(best_score, 0.97), nm
                     metodo = "gpt_disambiguation"
                     break
 
-    r = df.loc[best_idx]
-    out.update({
-        "bruto_referencial": _to_float(r.get("__BRUTO_COL__")),
-        "status": (str(r.get("__STATUS__")).strip() if r.get("__STATUS__") is not None else None),
-        "departamento": (str(r.get("__DEPTO__")).strip() if r.get("__DEPTO__") is not None else None),
-        "cargo": (str(r.get("__CARGO__")).strip() if r.get("__CARGO__") is not None else None),
-        "nome": str(r.get("__NOME_COL__", "")).strip().title() or nome,
-        "match_score": float(best_score),
-        "match_nome_planilha": str(best_nome).strip(),
-        "match_metodo": metodo,
-    })
+    out.update(_ref_from_row(df.loc[best_idx], nome, best_score, metodo))
     return out
+
+
+def match_colaboradores(df: pd.DataFrame, nomes: List[Optional[str]], *, gpt_batch_fn=None, **kwargs) -> pd.DataFrame:
+    """Concilia vários nomes de uma vez (uma linha de referência por nome, na mesma ordem).
+
+    Os matches exatos (nome normalizado único na planilha) saem de um único merge;
+    só o que sobra passa pela busca fuzzy/GPT de `find_colaborador_ref`.
+
+    `gpt_batch_fn(pares) -> escolhas` desambigua todos os casos duvidosos numa chamada só
+    (`pares` = [(nome, candidatos)], `escolhas` na mesma ordem, None quando não há match);
+    tem precedência sobre `gpt_match_fn`, que faria uma chamada por nome.
+    """
+    refs: List[Optional[Dict[str, Any]]] = [None] * len(nomes)
+    if df is not None and len(df) > 0 and nomes:
+        alvo = pd.DataFrame({"NOME_NORM": [norm_nome(n) for n in nomes]})
+        planilha = pd.DataFrame({"NOME_NORM": df["NOME_NORM"].to_numpy(), "__POS__": range(len(df))})
+        unicos = planilha[~planilha["NOME_NORM"].duplicated(keep=False)]
+        hits = alvo.merge(unicos, on="NOME_NORM", how="left", validate="m:1")
+        hits = hits[hits["__POS__"].notna()]
+        linhas = df.iloc[hits["__POS__"].astype(int)].to_dict(orient="records")
+        for i, r in zip(hits.index, linhas):
+            refs[i] = {**_empty_ref(), **_ref_from_row(r, nomes[i], 1.0, "nome_exato")}
+
+    pendentes = [i for i, r in enumerate(refs) if r is None]
+    indice = _indice_nomes(df) if pendentes and df is not None and len(df) > 0 else None
+    cands = {i: _top_candidates(df, nomes[i] or "", k=12, indice=indice) for i in pendentes} if indice is not None else {}
+
+    if gpt_batch_fn is not None and cands:
+        min_score = kwargs.get("min_score", 0.70)
+        force_gpt_below = kwargs.get("force_gpt_below", 0.95)
+        # 1ª passada: junta os nomes que iriam ao GPT (mesma regra de find_colaborador_ref)
+        duvidas: Dict[str, List[str]] = {}
+        for i, cs in cands.items():
+            if cs and cs[0][1] >= min_score and _precisa_gpt(cs, force_gpt_below):
+                duvidas.setdefault(nomes[i] or "", [c[2] for c in cs])
+        escolhas = dict(zip(duvidas, gpt_batch_fn(list(duvidas.items())))) if duvidas else {}
+        kwargs["gpt_match_fn"] = lambda nome, _candidatos: escolhas.get(nome)
+
+    for i in pendentes:
+        refs[i] = find_colaborador_ref(df, nomes[i], _indice=indice, _cands=cands.get(i), **kwargs)
+    return pd.DataFrame(refs, columns=list(_empty_ref()))
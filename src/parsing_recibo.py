@@ -1,15 +1,30 @@
 from __future__ import annotations
 
+import io
+import multiprocessing
 import os
 import re
-from typing import Dict, List, Optional, Tuple
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple, Union
 
 import pdfplumber
+import pypdfium2 as pdfium
 
 # Regex de dinheiro pt-BR (1.234,56)
 MONEY_RE = re.compile(r"(?:\d{1,3}(?:\.\d{3})*|\d+),(?:\d{2})")
 CPF_RE = re.compile(r"\b(\d{3}\.\d{3}\.\d{3}-\d{2})\b")
 
+# Regex usados por linha/evento: compilados uma vez aqui, não a cada chamada
+_INSS_RE = re.compile(r"\bINSS\b")
+_NAO_NUMERICO_RE = re.compile(r"[^0-9,\.\-]")
+_CABECALHO_TABELA_RE = re.compile(r"C[oó]digo\s+Descri[cç][aã]o\s+Refer[eê]ncia\s+Vencimentos\s+Descontos", re.IGNORECASE)
+_FIM_TABELA_RE = re.compile(r"Total\s+de\s+Vencimentos|Total\s+de\s+Descontos|Valor\s+L[ií]quido", re.IGNORECASE)
+_CODIGO_RE = re.compile(r"\d{2,4}")
+_HORA_RE = re.compile(r"\d{1,2}:\d{2}")
+_LINHA_SEM_CODIGO_RE = re.compile(r"^(?P<desc>.+?)\s+(?P<ref>\S+)\s+(?P<val>" + MONEY_RE.pattern + r")\s*$")
+
 
 # Mapeamento de códigos mais comuns do holerite (Contare) -> tipo
 # 'P' = provento, 'D' = desconto
@@ -41,6 +56,8 @@ DISCOUNT_KEYWORDS = (
     "INSS", "I.N.S.S", "DESC", "DESCONTO", "ATRAS", "FALTA", "MULTA", "PENAL",
     "RESSARC", "PREJUI", "ADIANT", "VALE", "PROCESSO",
 )
+# as palavras acima numa única alternância: uma busca por evento em vez de 13 testes `in`
+_DISCOUNT_RE = re.compile("|".join(re.escape(k) for k in DISCOUNT_KEYWORDS))
 
 
 def _infer_codigo_por_descricao(desc_up: str) -> Optional[str]:
@@ -50,7 +67,7 @@ def _infer_codigo_por_descricao(desc_up: str) -> Optional[str]:
     # descontos mais comuns
     if "INSS DIFERENCA" in desc_up or "INSS DIFERENÇA" in desc_up:
         return "821"
-    if "I.N.S.S" in desc_up or re.search(r"\bINSS\b", desc_up):
+    if "I.N.S.S" in desc_up or _INSS_RE.search(desc_up):
         return "998"
     if "DESC. CURSO" in desc_up or "DESC CURSO" in desc_up:
         return "686"
@@ -98,6 +115,8 @@ _MES_MAP = {
 
 def parse_money_any(x) -> Optional[float]:
     """Converte moeda pt-BR para float. Aceita float/int/string."""
+    if type(x) is float:  # caso mais comum (valor já numérico)
+        return x
     if x is None:
         return None
     if isinstance(x, (int, float)):
@@ -105,7 +124,7 @@ def parse_money_any(x) -> Optional[float]:
     s = str(x).strip()
     if not s:
         return None
-    s = re.sub(r"[^0-9,\.\-]", "", s)
+    s = _NAO_NUMERICO_RE.sub("", s)
     if not s:
         return None
     # se tem vírgula, assume decimal pt-BR
@@ -137,6 +156,15 @@ def _extract_totais(text: str) -> Tuple[Optional[float], Optional[float]]:
     return tv, td
 
 
+def _is_ref_token(tok: str) -> bool:
+    """Token de referência: tempo (5:38) ou número com vírgula (30,00)."""
+    if _HORA_RE.fullmatch(tok or ""):
+        return True
+    if MONEY_RE.fullmatch(tok or ""):
+        return True
+    return False
+
+
 def _regex_guess(text: str) -> Dict:
     """Extração determinística para holerites Contare (CNPJ + Mensalista + tabela de verbas)."""
     text = text or ""
@@ -180,12 +208,12 @@ def _regex_guess(text: str) -> Dict:
         s = " ".join(ln.split())
         if not s:
             continue
-        if re.search(r"C[oó]digo\s+Descri[cç][aã]o\s+Refer[eê]ncia\s+Vencimentos\s+Descontos", s, flags=re.IGNORECASE):
+        if _CABECALHO_TABELA_RE.search(s):
             if done_first_copy:
                 break
             in_table = True
             continue
-        if in_table and re.search(r"Total\s+de\s+Vencimentos|Total\s+de\s+Descontos|Valor\s+L[ií]quido", s, flags=re.IGNORECASE):
+        if in_table and _FIM_TABELA_RE.search(s):
             in_table = False
             if eventos:
                 done_first_copy = True
@@ -198,7 +226,7 @@ def _regex_guess(text: str) -> Dict:
             codigo = toks[0]
 
             # Se o primeiro token não é código numérico, tenta inferir pelo texto
-            if not re.fullmatch(r"\d{2,4}", str(codigo)):
+            if not _CODIGO_RE.fullmatch(str(codigo)):
                 desc_up_full = s.upper()
                 inferred = _infer_codigo_por_descricao(desc_up_full)
                 if inferred:
@@ -208,14 +236,6 @@ def _regex_guess(text: str) -> Dict:
                 else:
                     continue
 
-            # helper: identifica token de referência (tempo 5:38 ou número com vírgula)
-            def _is_ref_token(tok: str) -> bool:
-                if re.fullmatch(r"\d{1,2}:\d{2}", tok or ""):
-                    return True
-                if MONEY_RE.fullmatch(tok or ""):
-                    return True
-                return False
-
             # pega valores monetários do final (até 2 colunas: vencimentos e descontos)
             tail_money_str = []
             while len(toks) > 1 and MONEY_RE.fullmatch(toks[-1]):
@@ -301,12 +321,11 @@ def _regex_guess(text: str) -> Dict:
 
     # varredura suplementar: captura linhas que perderam a coluna 'Código' (pdfplumber às vezes separa o código em outra linha)
     # Ex.: "I.N.S.S 7,70 143,54" ou "DESC ADIANTAMENTO SALARIAL 500,00 500,00"
-    sup_pat = re.compile(r"^(?P<desc>.+?)\s+(?P<ref>\S+)\s+(?P<val>" + MONEY_RE.pattern + r")\s*$")
     for line in (text or "").splitlines():
         sline = (line or "").strip()
         if not sline:
             continue
-        mm = sup_pat.match(sline)
+        mm = _LINHA_SEM_CODIGO_RE.match(sline)
         if not mm:
             continue
         desc = mm.group("desc").strip()
@@ -328,7 +347,7 @@ def _regex_guess(text: str) -> Dict:
         provento = None
         desconto = None
         hint = CODE_HINT.get(str(cod))
-        if hint == "D" or any(k in desc_up for k in DISCOUNT_KEYWORDS):
+        if hint == "D" or _DISCOUNT_RE.search(desc_up):
             desconto = val
         else:
             provento = val
@@ -356,69 +375,72 @@ def _regex_guess(text: str) -> Dict:
     return {"competencia": comp, "nome": nome, "cpf": cpf, "liquido": liquido, "total_vencimentos": tv, "total_descontos": td, "eventos": dedup}
 
 
-def _gpt_extract(text: str, model: str) -> Dict:
-    """GPT primário para extração e classificação de eventos.
+_GPT_REGRAS = {
+    "codigos_desconto": sorted(list({ "255","981","998","686","8069","681","240","821","8808" })),
+    "codigos_provento": sorted(list({ "8781","8786","250","854","150","25","687","990","995","8112","8189","940" })),
+    "palavras_desconto": ["INSS","I.N.S.S","DESC","DESCONTO","ADIANT","VALE","ATRAS","FALTA","RESSARC","PREJUI","PROCESSO","MULTA","PENAL"],
+}
 
-    Estratégia:
-    - Extrai competência, nome, CPF (se houver), totais (vencimentos/descontos) e lista de eventos.
-    - Para cada evento, devolve explicitamente provento e/ou desconto (number ou null).
-    - Usa os totais como restrição de consistência (quando presentes).
+_GPT_SYSTEM = (
+    "Você extrai dados de holerites brasileiros. Responda APENAS JSON válido. "
+    "Não invente; se não encontrar no texto, use null. "
+    "Classifique corretamente proventos e descontos."
+)
+
+_GPT_OBSERVACAO = (
+    "Se um evento tiver somente 1 valor monetário na linha, decida se é provento ou desconto "
+    "pelas regras (código/palavras) e pelo contexto dos totais. "
+    "Se houver 'Total de Vencimentos' e 'Total de Descontos' no texto, use como checagem: "
+    "a soma dos proventos deve se aproximar do total de vencimentos e a soma dos descontos do total de descontos."
+)
+
+_GPT_SAIDA_HOLERITE = {
+    "competencia": "MM/AAAA ou null",
+    "nome": "string ou null",
+    "cpf": "000.000.000-00 ou null",
+    "total_vencimentos": "number ou null",
+    "total_descontos": "number ou null",
+    "valor_liquido": "number ou null",
+    "eventos": [
+        {"codigo": "string", "descricao": "string", "referencia": "string|null", "provento": "number|null", "desconto": "number|null"}
+    ],
+}
+
+# lote de páginas por requisição: limitado pelo tamanho da resposta (todos os eventos voltam no JSON)
+_GPT_LOTE_MAX_PAGINAS = 10
+_GPT_LOTE_MAX_CHARS = 30000
+
+
+@lru_cache(maxsize=4)
+def openai_client(api_key: str):
+    """Um cliente (pool de conexões HTTPS) por chave, reaproveitado por todas as chamadas e threads.
+
+    Usado também pela desambiguação de nomes do app, para não manter dois pools por chave.
     """
+    from openai import OpenAI
+    return OpenAI(api_key=api_key)
+
+
+def _gpt_responder(payload: Dict, model: str, system: str = _GPT_SYSTEM) -> Dict:
+    """Uma chamada ao GPT (payload em JSON, resposta em JSON); {} se não houver chave ou der erro."""
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         return {}
 
     try:
-        from openai import OpenAI
         import json
+        client = openai_client(api_key)
     except Exception:
         return {}
 
-    client = OpenAI(api_key=api_key)
-
-    rules = {
-        "codigos_desconto": sorted(list({ "255","981","998","686","8069","681","240","821","8808" })),
-        "codigos_provento": sorted(list({ "8781","8786","250","854","150","25","687","990","995","8112","8189","940" })),
-        "palavras_desconto": ["INSS","I.N.S.S","DESC","DESCONTO","ADIANT","VALE","ATRAS","FALTA","RESSARC","PREJUI","PROCESSO","MULTA","PENAL"],
-    }
-
-    system = (
-        "Você extrai dados de holerites brasileiros. Responda APENAS JSON válido. "
-        "Não invente; se não encontrar no texto, use null. "
-        "Classifique corretamente proventos e descontos."
-    )
-
-    user = {
-        "tarefa": "Extrair holerite",
-        "regras_classificacao": rules,
-        "observacao": (
-            "Se um evento tiver somente 1 valor monetário na linha, decida se é provento ou desconto "
-            "pelas regras (código/palavras) e pelo contexto dos totais. "
-            "Se houver 'Total de Vencimentos' e 'Total de Descontos' no texto, use como checagem: "
-            "a soma dos proventos deve se aproximar do total de vencimentos e a soma dos descontos do total de descontos."
-        ),
-        "saida_json": {
-                "competencia": "MM/AAAA ou null",
-                "nome": "string ou null",
-                "cpf": "000.000.000-00 ou null",
-                "total_vencimentos": "number ou null",
-                "total_descontos": "number ou null",
-            "valor_liquido": "number ou null",
-                "eventos": [
-                {"codigo": "string", "descricao": "string", "referencia": "string|null", "provento": "number|null", "desconto": "number|null"}
-            ],
-        },
-        "texto": (text or "")[:14000],
-    }
-
     try:
         resp = client.responses.create(
             model=model,
             input=[
                 {"role": "system", "content": system},
-                {"role": "user", "content": json.dumps(user, ensure_ascii=False)},
+                {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
             ],
-            response_format={"type": "json_object"},
+            text={"format": {"type": "json_object"}},
         )
         data = json.loads(resp.output_text or "{}")
         return data if isinstance(data, dict) else {}
@@ -426,18 +448,70 @@ def _gpt_extract(text: str, model: str) -> Dict:
         return {}
 
 
+def _gpt_extract(text: str, model: str) -> Dict:
+    """GPT como fallback de extração e classificação de eventos (páginas em que o regex não fecha).
+
+    Estratégia:
+    - Extrai competência, nome, CPF (se houver), totais (vencimentos/descontos) e lista de eventos.
+    - Para cada evento, devolve explicitamente provento e/ou desconto (number ou null).
+    - Usa os totais como restrição de consistência (quando presentes).
+    """
+    return _gpt_responder({
+        "tarefa": "Extrair holerite",
+        "regras_classificacao": _GPT_REGRAS,
+        "observacao": _GPT_OBSERVACAO,
+        "saida_json": _GPT_SAIDA_HOLERITE,
+        "texto": (text or "")[:14000],
+    }, model)
+
+
+def _gpt_extract_lote(textos: List[str], model: str) -> List[Dict]:
+    """Mesmo que `_gpt_extract`, mas vários holerites (páginas) numa única requisição.
+
+    Devolve um dict por texto, na mesma ordem; página sem resposta vira {}.
+    """
+    if len(textos) == 1:
+        return [_gpt_extract(textos[0], model)]
+
+    data = _gpt_responder({
+        "tarefa": "Extrair holerites (um por página, cada página é um colaborador)",
+        "regras_classificacao": _GPT_REGRAS,
+        "observacao": _GPT_OBSERVACAO,
+        "saida_json": {"holerites": [{"pagina": "int (o mesmo da entrada)", **_GPT_SAIDA_HOLERITE}]},
+        "paginas": [{"pagina": k, "texto": (t or "")[:14000]} for k, t in enumerate(textos)],
+    }, model)
+
+    por_pagina: Dict[int, Dict] = {}
+    for h in data.get("holerites") or []:
+        if not isinstance(h, dict):
+            continue
+        # o modelo às vezes ecoa a página como texto ("3") ou float (3.0)
+        try:
+            por_pagina[int(h.get("pagina"))] = h
+        except (TypeError, ValueError):
+            continue
+    return [por_pagina.get(k, {}) for k in range(len(textos))]
+
+
+def _lotes_gpt(indices: List[int], textos: List[str]) -> List[List[int]]:
+    """Agrupa as páginas pendentes em lotes de até _GPT_LOTE_MAX_PAGINAS / _GPT_LOTE_MAX_CHARS."""
+    lotes: List[List[int]] = []
+    atual: List[int] = []
+    chars = 0
+    for i in indices:
+        n = min(len(textos[i]), 14000)
+        if atual and (len(atual) >= _GPT_LOTE_MAX_PAGINAS or chars + n > _GPT_LOTE_MAX_CHARS):
+            lotes.append(atual)
+            atual, chars = [], 0
+        atual.append(i)
+        chars += n
+    if atual:
+        lotes.append(atual)
+    return lotes
+
+
 def _gpt_refine_events(text: str, model: str, base: Dict, attempt_note: str) -> Dict:
     """Segunda passada GPT quando a reconciliação por totais falhar."""
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        return {}
-    try:
-        from openai import OpenAI
-        import json
-    except Exception:
-        return {}
-
-    client = OpenAI(api_key=api_key)
     system = (
         "Você corrige uma extração de holerite. Responda APENAS JSON. "
         "Ajuste somente a classificação provento/desconto e referências/valores se necessário, "
@@ -463,22 +537,16 @@ def _gpt_refine_events(text: str, model: str, base: Dict, attempt_note: str) ->
             ],
         },
     }
-    try:
-        resp = client.responses.create(
-            model=model,
-            input=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
-            ],
-            response_format={"type": "json_object"},
-        )
-        data = json.loads(resp.output_text or "{}")
-        return data if isinstance(data, dict) else {}
-    except Exception:
-        return {}
-
+    return _gpt_responder(payload, model, system=system)
 
 
+def _somar_eventos(eventos: List[Dict]) -> Tuple[float, float]:
+    """Soma proventos e descontos numa única passada."""
+    sv = sd = 0.0
+    for e in eventos:
+        sv += e.get("provento") or 0
+        sd += e.get("desconto") or 0
+    return sv, sd
 
 
 def _post_process_eventos(eventos: List[Dict], total_venc: Optional[float] = None, total_desc: Optional[float] = None) -> List[Dict]:
@@ -493,9 +561,6 @@ def _post_process_eventos(eventos: List[Dict], total_venc: Optional[float] = Non
 
     # 'P' provento, 'D' desconto
     code_hint = globals().get("CODE_HINT", {})
-    discount_keywords = tuple(globals().get("DISCOUNT_KEYWORDS", ())) or (
-        "INSS","I.N.S.S","DESC","DESCONTO","ADIANT","VALE","ATRAS","FALTA","RESSARC","PREJUI","PROCESSO","MULTA","PENAL"
-    )
 
     def is_discount(codigo: str, desc_up: str) -> bool:
         hint = code_hint.get(codigo)
@@ -503,7 +568,7 @@ def _post_process_eventos(eventos: List[Dict], total_venc: Optional[float] = Non
             return True
         if hint == "P":
             return False
-        return any(k in desc_up for k in discount_keywords)
+        return _DISCOUNT_RE.search(desc_up) is not None
 
     out: List[Dict] = []
     ambiguous_idx: List[int] = []
@@ -540,14 +605,13 @@ def _post_process_eventos(eventos: List[Dict], total_venc: Optional[float] = Non
             desconto = None
 
         if (provento is not None) ^ (desconto is not None):
-            if codigo not in code_hint and not any(k in desc_up for k in discount_keywords):
+            if codigo not in code_hint and not _DISCOUNT_RE.search(desc_up):
                 ambiguous_idx.append(len(out))
 
         out.append({**e, "provento": provento, "desconto": desconto})
 
     if total_venc is not None or total_desc is not None:
-        sv = sum((e.get("provento") or 0) for e in out)
-        sd = sum((e.get("desconto") or 0) for e in out)
+        sv, sd = _somar_eventos(out)
 
         def objective(sv, sd):
             ev = abs(total_venc - sv) if total_venc is not None else 0.0
@@ -580,87 +644,272 @@ def _post_process_eventos(eventos: List[Dict], total_venc: Optional[float] = Non
     return out
 
 
-def parse_recibo_pagamento_pdf(pdf_path: str, use_gpt: bool = True, openai_model: str = "gpt-4.1") -> Tuple[List[Dict], Optional[str]]:
-    results: List[Dict] = []
-    competencia_global: Optional[str] = None
-
-    with pdfplumber.open(pdf_path) as pdf:
-        for idx, page in enumerate(pdf.pages):
-            txt = page.extract_text() or ""
-
-            base = _regex_guess(txt)
-            data = _gpt_extract(txt, openai_model) if use_gpt else {}
-
-            # merge: GPT só sobrescreve quando traz valor útil
-            comp = data.get("competencia") or base.get("competencia")
-            nome = data.get("nome") or base.get("nome")
-            cpf = data.get("cpf") or base.get("cpf")
-
-            tv = data.get("total_vencimentos")
-            td = data.get("total_descontos")
-            if tv is None:
-                tv = base.get("total_vencimentos")
-            if td is None:
-                td = base.get("total_descontos")
-
-            liquido = data.get("valor_liquido")
-            if liquido is None:
-                liquido = base.get("liquido")
-
-            eventos = data.get("eventos")
-            if not isinstance(eventos, list) or len(eventos) == 0:
-                eventos = base.get("eventos") or []
-
-            # pós-processamento + reconciliação com totais (se existirem)
-            eventos = _post_process_eventos(eventos, tv, td)
-
-            def _sum(evts):
-                sv = sum((e.get("provento") or 0) for e in evts)
-                sd = sum((e.get("desconto") or 0) for e in evts)
-                return sv, sd
-
-            # Se há totais e o erro é grande, tenta 1 refinamento GPT focado em bater totals.
-            if use_gpt and (tv is not None or td is not None):
-                sv, sd = _sum(eventos)
-                mismatch = 0.0
-                if tv is not None:
-                    mismatch += abs(tv - sv)
-                if td is not None:
-                    mismatch += abs(td - sd)
-
-                if mismatch > 2.0:
-                    refined = _gpt_refine_events(
-                        txt,
-                        openai_model,
-                        {"total_vencimentos": tv, "total_descontos": td, "eventos": eventos},
-                        attempt_note=f"mismatch={mismatch:.2f} (sv={sv:.2f}, sd={sd:.2f}, tv={tv}, td={td})",
-                    )
-                    if isinstance(refined, dict) and isinstance(refined.get("eventos"), list) and refined.get("eventos"):
-                        tv2 = refined.get("total_vencimentos") or tv
-                        td2 = refined.get("total_descontos") or td
-                        eventos2 = _post_process_eventos(refined["eventos"], tv2, td2)
-                        sv2, sd2 = _sum(eventos2)
-                        mismatch2 = 0.0
-                        if tv2 is not None:
-                            mismatch2 += abs(tv2 - sv2)
-                        if td2 is not None:
-                            mismatch2 += abs(td2 - sd2)
-                        if mismatch2 + 0.01 < mismatch:
-                            eventos, tv, td = eventos2, tv2, td2
-
-            if comp and not competencia_global:
-                competencia_global = comp
-
-            results.append({
-                "page_index": idx,
-                "competencia": comp,
-                "nome": nome,
-                "cpf": cpf,
-                "liquido": liquido,
-                "total_vencimentos": tv,
-                "total_descontos": td,
-                "eventos": eventos,
-                "raw_text": txt,
-            })
+# releitura pelo pdfplumber: ~50 ms por página; subir um processo (spawn + imports): ~0,7 s.
+# Cada worker só compensa com algumas dezenas de páginas a reler (o PDFium faz ~1 ms/página e fica no processo)
+_MIN_PAGINAS_POR_WORKER = 30
+
+# PDFium não é thread-safe (nem entre documentos distintos) e o Streamlit roda cada sessão numa thread
+_PDFIUM_LOCK = threading.Lock()
+
+# PDF do processo worker (definido uma vez por processo no initializer do pool)
+_WORKER_PDF_BYTES: Optional[bytes] = None
+
+
+def _init_worker(pdf_bytes: bytes) -> None:
+    global _WORKER_PDF_BYTES
+    _WORKER_PDF_BYTES = pdf_bytes
+
 
+def _read_pdf_bytes(pdf_path: Union[str, bytes, BinaryIO]) -> bytes:
+    if isinstance(pdf_path, bytes):
+        return pdf_path
+    if isinstance(pdf_path, str):
+        with open(pdf_path, "rb") as f:
+            return f.read()
+    if hasattr(pdf_path, "getvalue"):
+        return pdf_path.getvalue()
+    pdf_path.seek(0)
+    return pdf_path.read()
+
+
+def _texto_incompleto(txt: str) -> bool:
+    """True quando o regex não acha nem a estrutura do holerite (eventos, nome, líquido) no texto."""
+    if not txt.strip():
+        return True
+    base = _regex_guess(txt)
+    return not base.get("eventos") or not base.get("nome") or base.get("liquido") is None
+
+
+def _extract_pages_text_pdfium(pdf_bytes: bytes) -> List[str]:
+    """Texto de todas as páginas pelo PDFium (ordem do content stream)."""
+    textos: List[str] = []
+    with _PDFIUM_LOCK:
+        doc = pdfium.PdfDocument(pdf_bytes)
+        try:
+            for i in range(len(doc)):
+                page = doc[i]
+                textpage = page.get_textpage()
+                textos.append("\n".join(textpage.get_text_range().splitlines()))
+                textpage.close()
+                page.close()
+        finally:
+            doc.close()
+    return textos
+
+
+def _extract_pages_text_pdfplumber(pdf_bytes: bytes, paginas: List[int]) -> List[str]:
+    """Texto de algumas páginas pelo pdfplumber (agrupado pelo layout, como o regex espera)."""
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        return [pdf.pages[i].extract_text() or "" for i in paginas]
+
+
+def _extract_pages_text_worker(paginas: List[int]) -> List[str]:
+    return _extract_pages_text_pdfplumber(_WORKER_PDF_BYTES, paginas)
+
+
+def extract_pages_text(pdf_path: Union[str, bytes, BinaryIO], max_workers: int = 1) -> List[str]:
+    """Texto de cada página do PDF, na ordem.
+
+    Usa PDFium (pypdfium2) para a camada de texto. O PDFium devolve o texto na ordem do content
+    stream e o regex foi afinado no layout do pdfplumber (ex.: tabela desenhada coluna a coluna
+    vira uma célula por linha e perde os eventos): página vazia ou sem eventos/nome/líquido é
+    relida pelo pdfplumber. Página que só não bate com os totais fica como está (holerite sem
+    "Total de" nunca fecharia). Com `max_workers > 1` e releituras suficientes, elas são
+    divididas entre processos separados.
+    """
+    pdf_bytes = _read_pdf_bytes(pdf_path)
+    textos = _extract_pages_text_pdfium(pdf_bytes)
+    revisar = [i for i, txt in enumerate(textos) if _texto_incompleto(txt)]
+    if not revisar:
+        return textos
+
+    workers = min(max_workers, len(revisar) // _MIN_PAGINAS_POR_WORKER)
+    if workers <= 1:
+        relidos = _extract_pages_text_pdfplumber(pdf_bytes, revisar)
+    else:
+        step = -(-len(revisar) // workers)
+        blocos = [revisar[i:i + step] for i in range(0, len(revisar), step)]
+        # spawn: o servidor do Streamlit tem várias threads, fork não é seguro
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker, initargs=(pdf_bytes,)) as ex:
+            relidos = [txt for bloco in ex.map(_extract_pages_text_worker, blocos) for txt in bloco]
+    for i, txt in zip(revisar, relidos):
+        textos[i] = txt
+    return textos
+
+
+# abaixo disso a página não tem camada de texto útil (escaneada/vazia): nem regex nem GPT resolvem
+_MIN_CHARS_TEXTO = 40
+
+
+def _divergencia(tv: Optional[float], td: Optional[float], sv: float, sd: float) -> float:
+    """Erro absoluto entre os totais do holerite (quando existem) e as somas dos eventos."""
+    erro = 0.0
+    if tv is not None:
+        erro += abs(tv - sv)
+    if td is not None:
+        erro += abs(td - sd)
+    return erro
+
+
+def _eventos_regex(base: Dict) -> List[Dict]:
+    """Eventos do regex já pós-processados com os totais do regex (calculado uma vez por página)."""
+    return _post_process_eventos(base.get("eventos") or [], base.get("total_vencimentos"), base.get("total_descontos"))
+
+
+def _regex_confere(base: Dict, eventos_regex: List[Dict]) -> bool:
+    """True quando a extração por regex já é confiável: nome, líquido, eventos e totais batendo.
+
+    `eventos_regex` é o resultado de `_eventos_regex(base)`.
+    """
+    tv, td = base.get("total_vencimentos"), base.get("total_descontos")
+    if not base.get("eventos") or not base.get("nome") or base.get("liquido") is None or (tv is None and td is None):
+        return False
+    sv, sd = _somar_eventos(eventos_regex)
+    return _divergencia(tv, td, sv, sd) <= 2.0
+
+
+def open_pdf_document(pdf_bytes: bytes) -> "pdfium.PdfDocument":
+    """Abre o PDF uma vez para renderizações repetidas (ver `render_page_image`)."""
+    with _PDFIUM_LOCK:
+        return pdfium.PdfDocument(pdf_bytes)
+
+
+def render_page_image(pdf: Union[bytes, "pdfium.PdfDocument"], page_index: int, dpi: int = 170):
+    """Renderiza uma página do PDF como PIL.Image (PDFium, sem passar pelo pdfminer).
+
+    Aceita os bytes (abre e fecha o documento aqui) ou um documento já aberto por
+    `open_pdf_document`, que fica aberto para as próximas páginas.
+    """
+    with _PDFIUM_LOCK:
+        doc = pdf if isinstance(pdf, pdfium.PdfDocument) else pdfium.PdfDocument(pdf)
+        try:
+            page = doc[int(page_index)]
+            img = page.render(scale=dpi / 72).to_pil()
+            page.close()
+        finally:
+            if doc is not pdf:
+                doc.close()
+    return img
+
+
+def _parse_pagina(idx: int, txt: str, base: Dict, data: Dict, use_gpt: bool, openai_model: str,
+                  eventos_regex: Optional[List[Dict]] = None) -> Dict:
+    """Monta um colaborador (uma página) a partir do regex (`base`) e do GPT (`data`) e reconcilia com os totais.
+
+    `eventos_regex` (de `_eventos_regex`) evita pós-processar de novo os eventos do regex.
+    """
+    # merge: GPT só sobrescreve quando traz valor útil
+    comp = data.get("competencia") or base.get("competencia")
+    nome = data.get("nome") or base.get("nome")
+    cpf = data.get("cpf") or base.get("cpf")
+
+    tv = data.get("total_vencimentos")
+    td = data.get("total_descontos")
+    if tv is None:
+        tv = base.get("total_vencimentos")
+    if td is None:
+        td = base.get("total_descontos")
+
+    liquido = data.get("valor_liquido")
+    if liquido is None:
+        liquido = base.get("liquido")
+
+    eventos = data.get("eventos")
+    if isinstance(eventos, list) and len(eventos) > 0:
+        # pós-processamento + reconciliação com totais (se existirem)
+        eventos = _post_process_eventos(eventos, tv, td)
+    elif eventos_regex is not None and tv == base.get("total_vencimentos") and td == base.get("total_descontos"):
+        eventos = eventos_regex  # mesmos eventos e totais: já pós-processados
+    else:
+        eventos = _post_process_eventos(base.get("eventos") or [], tv, td)
+
+    # Se há totais e o erro é grande, tenta 1 refinamento GPT focado em bater totals.
+    if use_gpt and (tv is not None or td is not None):
+        sv, sd = _somar_eventos(eventos)
+        mismatch = _divergencia(tv, td, sv, sd)
+
+        if mismatch > 2.0:
+            refined = _gpt_refine_events(
+                txt,
+                openai_model,
+                {"total_vencimentos": tv, "total_descontos": td, "eventos": eventos},
+                attempt_note=f"mismatch={mismatch:.2f} (sv={sv:.2f}, sd={sd:.2f}, tv={tv}, td={td})",
+            )
+            if isinstance(refined, dict) and isinstance(refined.get("eventos"), list) and refined.get("eventos"):
+                tv2 = refined.get("total_vencimentos") or tv
+                td2 = refined.get("total_descontos") or td
+                eventos2 = _post_process_eventos(refined["eventos"], tv2, td2)
+                sv2, sd2 = _somar_eventos(eventos2)
+                mismatch2 = _divergencia(tv2, td2, sv2, sd2)
+                if mismatch2 + 0.01 < mismatch:
+                    eventos, tv, td = eventos2, tv2, td2
+
+    return {
+        "page_index": idx,
+        "competencia": comp,
+        "nome": nome,
+        "cpf": cpf,
+        "liquido": liquido,
+        "total_vencimentos": tv,
+        "total_descontos": td,
+        "eventos": eventos,
+        "raw_text": txt,
+    }
+
+
+def parse_recibo_pagamento_pdf(pdf_path: Union[str, bytes, BinaryIO], use_gpt: bool = True, openai_model: str = "gpt-4.1", max_workers: int = 1, force_gpt: bool = False, gpt_workers: int = 4, progresso: Optional[Callable[[str], None]] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Lê o holerite página a página. `pdf_path` pode ser caminho, bytes ou arquivo em memória (BytesIO).
+
+    Regex primeiro; com `use_gpt`, o GPT só é chamado nas páginas em que o regex não fecha
+    (faltam campos ou os eventos não batem com os totais). `force_gpt` chama em todas.
+    As páginas pendentes vão ao GPT em lotes, com até `gpt_workers` requisições simultâneas.
+    `progresso`, se informado, recebe uma mensagem a cada etapa (e pode levantar exceção para interromper).
+    """
+    avisar = progresso or (lambda msg: None)
+    pdf_bytes = _read_pdf_bytes(pdf_path)
+    textos = extract_pages_text(pdf_bytes, max_workers=max_workers)
+    avisar(f"Texto extraído: {len(textos)} página(s)")
+    bases = [_regex_guess(txt) for txt in textos]
+
+    eventos_regex = [_eventos_regex(base) for base in bases]
+    fecha = [_regex_confere(base, ev) for base, ev in zip(bases, eventos_regex)]
+
+    pendentes = [
+        i for i, txt in enumerate(textos)
+        if use_gpt and len(txt.strip()) >= _MIN_CHARS_TEXTO and (force_gpt or not fecha[i])
+    ]
+    gpt: Dict[int, Dict] = {}
+    # regex/reconciliação custam ~0,2 ms por página; o que demora é esperar a rede (threads bastam).
+    # Tudo vai como futures: `avisar` pode levantar (cancelamento) entre conclusões e, nesse caso,
+    # o shutdown descarta o que ainda está na fila sem esperar os lotes pendentes.
+    ex = ThreadPoolExecutor(max_workers=max(1, gpt_workers))
+    try:
+        if pendentes:
+            lotes = _lotes_gpt(pendentes, textos)
+            avisar(f"GPT: {len(pendentes)} página(s) em {len(lotes)} lote(s)")
+            futuros = {ex.submit(_gpt_extract_lote, [textos[i] for i in lote], openai_model): lote for lote in lotes}
+            for k, fut in enumerate(as_completed(futuros), start=1):
+                gpt.update(zip(futuros[fut], fut.result()))
+                avisar(f"GPT: lote {k}/{len(lotes)} concluído")
+
+        def _pagina(i: int) -> Dict:
+            return _parse_pagina(i, textos[i], bases[i], gpt.get(i, {}), use_gpt, openai_model, eventos_regex[i])
+
+        # o refinamento (_gpt_refine_events) continua por página, só onde os totais não batem
+        n = len(textos)
+        avisar("Conciliando eventos com os totais")
+        results: List[Optional[Dict]] = [None] * n
+        if use_gpt and n > 1:
+            futuros = {ex.submit(_pagina, i): i for i in range(n)}
+            feitas = ((futuros[f], f.result()) for f in as_completed(futuros))
+        else:
+            feitas = ((i, _pagina(i)) for i in range(n))
+        for k, (i, r) in enumerate(feitas, start=1):
+            results[i] = r
+            avisar(f"Conciliando eventos com os totais ({k}/{n})")
+    finally:
+        ex.shutdown(wait=False, cancel_futures=True)
+
+    competencia_global = next((r["competencia"] for r in results if r["competencia"]), None)
     return results, competencia_global
@@ -1,13 +1,17 @@
 from __future__ import annotations
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional, Tuple, Union
+import pandas as pd
 from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
 from reportlab.pdfgen.canvas import Canvas
 from reportlab.lib.units import mm
 
-import pdfplumber
-import tempfile
 import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from src.parsing_recibo import render_page_image
 
 def _fmt(v) -> str:
     try:
@@ -16,7 +20,7 @@ def _fmt(v) -> str:
     except Exception:
         return "-"
 
-def generate_receipt_pdf(row: Dict, out_pdf: str, logo_path: Optional[str] = None, empresa_nome: str = "Contare", holerite_pdf_bytes: Optional[bytes] = None, holerite_page_index: int = 0) -> str:
+def generate_receipt_pdf(row: Dict, out_pdf: Union[str, BinaryIO], logo_path: Optional[str] = None, empresa_nome: str = "Contare", holerite_pdf_bytes: Optional[bytes] = None, holerite_page_index: int = 0) -> Union[str, BinaryIO]:
     c = Canvas(out_pdf, pagesize=A4)
     W, H = A4
     m = 12*mm
@@ -70,9 +74,7 @@ def generate_receipt_pdf(row: Dict, out_pdf: str, logo_path: Optional[str] = Non
     # 2ª página: Espelho do holerite CLT (imagem) — para conferência
     if holerite_pdf_bytes:
         try:
-            with pdfplumber.open(io.BytesIO(holerite_pdf_bytes)) as pdf:
-                page = pdf.pages[int(holerite_page_index)]
-                img = page.to_image(resolution=170).original  # PIL.Image
+            img = render_page_image(holerite_pdf_bytes, holerite_page_index, dpi=170)
 
             c.showPage()
             c.setFont("Helvetica-Bold", 12)
@@ -84,26 +86,74 @@ def generate_receipt_pdf(row: Dict, out_pdf: str, logo_path: Optional[str] = Non
             scale = min(max_w / iw, max_h / ih)
             dw, dh = iw * scale, ih * scale
 
-            with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tf:
-                img.save(tf.name, format="PNG")
-                png_path = tf.name
-
-            c.drawImage(png_path, x, H - m - dh, width=dw, height=dh, preserveAspectRatio=True, mask="auto")
+            c.drawImage(ImageReader(img), x, H - m - dh, width=dw, height=dh, preserveAspectRatio=True, mask="auto")
         except Exception:
             pass
 
     c.showPage(); c.save()
     return out_pdf
 
-def generate_all_receipts(rows: List[Dict], out_dir: str, empresa_nome: str = "Contare", logo_path: Optional[str] = None, holerite_pdf_bytes: Optional[bytes] = None) -> List[str]:
-    Path(out_dir).mkdir(parents=True, exist_ok=True)
-    out = []
-    for r in rows:
-        cpf = (r.get("cpf") or "").replace(".", "").replace("-", "")
-        nm = (r.get("nome") or "COLAB").replace(" ", "_")[:25]
-        comp = (r.get("competencia") or "MM-AAAA").replace("/", "-")
-        fn = f"recibo_complementar_{comp}_{cpf}_{nm}.pdf"
-        p = str(Path(out_dir) / fn)
-        generate_receipt_pdf(r, p, logo_path=logo_path, empresa_nome=empresa_nome, holerite_pdf_bytes=holerite_pdf_bytes, holerite_page_index=int(r.get('page_index') or 0))
-        out.append(p)
-    return out
+# colunas do consolidado que o recibo usa (o resto — eventos, raw_text... — não precisa ser materializado)
+RECEIPT_FIELDS = (
+    "nome", "cpf", "competencia", "page_index",
+    "remuneracao_bruta_planilha", "bruto_planilha", "referencia_8781", "remuneracao_bruta_proporcional",
+    "outros_proventos", "desc_adiantamento_981", "981_desc_adiantamento", "desc_inss_998", "998_inss",
+    "outros_descontos", "valor_a_pagar",
+)
+
+def _iter_rows(df: pd.DataFrame) -> Iterator[Dict]:
+    """Percorre o DataFrame por colunas (listas nativas), montando só os campos do recibo.
+
+    Ausentes (NaN/NA) viram None, como o recibo espera.
+    """
+    cols = [c for c in RECEIPT_FIELDS if c in df.columns]
+    for vals in zip(*(df[c].astype(object).where(df[c].notna(), None).tolist() for c in cols)):
+        yield dict(zip(cols, vals))
+
+def _receipt_filename(r: Dict) -> str:
+    cpf = (r.get("cpf") or "").replace(".", "").replace("-", "")
+    nm = (r.get("nome") or "COLAB").replace(" ", "_")[:25]
+    comp = (r.get("competencia") or "MM-AAAA").replace("/", "-")
+    return f"recibo_complementar_{comp}_{cpf}_{nm}.pdf"
+
+def _gerar_recibo(r: Dict, empresa_nome: str, logo_path: Optional[str], holerite_pdf_bytes: Optional[bytes]) -> Tuple[str, bytes]:
+    buf = io.BytesIO()
+    generate_receipt_pdf(r, buf, logo_path=logo_path, empresa_nome=empresa_nome, holerite_pdf_bytes=holerite_pdf_bytes, holerite_page_index=int(r.get('page_index') or 0))
+    return _receipt_filename(r), buf.getvalue()
+
+# reportlab é Python puro (preso ao GIL) e o PDFium é serializado por lock: paralelismo só com processos,
+# e subir cada processo (spawn + imports) custa mais que alguns recibos
+_MIN_RECIBOS_POR_WORKER = 8
+
+# opções comuns do processo worker (definidas uma vez por processo no initializer do pool)
+_WORKER_OPCOES: Dict = {}
+
+def _init_worker(opcoes: Dict) -> None:
+    global _WORKER_OPCOES
+    _WORKER_OPCOES = opcoes
+
+def _gerar_recibo_worker(r: Dict) -> Tuple[str, bytes]:
+    return _gerar_recibo(r, **_WORKER_OPCOES)
+
+def generate_all_receipts_iter(rows: Union[pd.DataFrame, Iterable[Dict]], empresa_nome: str = "Contare", logo_path: Optional[str] = None, holerite_pdf_bytes: Optional[bytes] = None, max_workers: int = 1) -> Iterator[Tuple[str, bytes]]:
+    """Gera os recibos em memória: um par (nome do arquivo, bytes do PDF) por linha, sem passar pelo disco.
+
+    `rows` pode ser o DataFrame consolidado (lido por colunas) ou uma lista de dicts.
+    Com `max_workers > 1` (e recibos suficientes) os PDFs são gerados em processos separados;
+    a ordem de saída é sempre a de `rows`.
+    """
+    n = len(rows) if hasattr(rows, "__len__") else 0
+    if isinstance(rows, pd.DataFrame):
+        rows = _iter_rows(rows)
+    opcoes = {"empresa_nome": empresa_nome, "logo_path": logo_path, "holerite_pdf_bytes": holerite_pdf_bytes}
+
+    workers = min(max_workers, n // _MIN_RECIBOS_POR_WORKER)
+    if workers <= 1:
+        for r in rows:
+            yield _gerar_recibo(r, **opcoes)
+        return
+
+    # spawn: o servidor do Streamlit tem várias threads, fork não é seguro
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker, initargs=(opcoes,)) as ex:
+        yield from ex.map(_gerar_recibo_worker, rows, chunksize=4)